@@ -0,0 +1,195 @@
+"""
+Offline pre-generation of videos for a list of topics.
+
+Reads topics from a JSONL file (one `{"topic": "..."}` object or bare JSON string per line),
+skips anything already in the generation cache, and renders the rest with bounded Gemini
+and Manim concurrency. Progress is checkpointed after every topic so an interrupted run
+can be resumed, and a results manifest is written at the end.
+
+Usage:
+    python batch_generate.py topics.jsonl --llm-concurrency 2 --render-concurrency 1
+"""
+import argparse
+import json
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+import config
+import main as video_generator
+
+DEFAULT_CHECKPOINT = Path("batch_checkpoint.json")
+DEFAULT_MANIFEST = Path("batch_manifest.json")
+
+
+def read_topics(input_path):
+    """
+    Reads topics from a JSONL file, dropping blanks and duplicates while keeping order.
+    Topics that map to the same module name (e.g. "Fourier Transform" and "fourier transform")
+    would write the same script and media folder, so only the first is kept.
+    Returns (topics, duplicates) where duplicates maps each dropped topic to the one kept.
+    """
+    topics = []
+    duplicates = {}
+    kept_by_module = {}
+    with open(input_path, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                print(f"Warning: skipping invalid JSON on line {line_number}")
+                continue
+            if isinstance(record, dict):
+                topic = record.get("topic") or record.get("prompt")
+            else:
+                topic = record
+            if not isinstance(topic, str) or not topic.strip():
+                print(f"Warning: no topic found on line {line_number}")
+                continue
+            topic = topic.strip()
+            module_name = video_generator.sanitize_topic_module(topic)
+            if module_name not in kept_by_module:
+                kept_by_module[module_name] = topic
+                topics.append(topic)
+            elif kept_by_module[module_name] != topic:
+                print(f"Warning: '{topic}' on line {line_number} duplicates '{kept_by_module[module_name]}', skipping it")
+                duplicates[topic] = kept_by_module[module_name]
+    return topics, duplicates
+
+
+def find_cached_video(topic, cache):
+    """
+    Returns the video path parts of an existing render for the topic, or None.
+    Matched by module name, so "Circle" finds a video cached under "circle".
+    """
+    _, entry = video_generator.find_cache_entry(video_generator.sanitize_topic_module(topic), cache)
+    if not entry:
+        return None
+    video_path = Path.cwd() / "media" / "videos" / "/".join(entry["video_path_parts"])
+    return entry["video_path_parts"] if video_path.exists() else None
+
+
+def load_checkpoint(checkpoint_path):
+    """Loads the results recorded by a previous (possibly interrupted) run."""
+    if checkpoint_path.exists():
+        try:
+            return json.loads(checkpoint_path.read_text(encoding='utf-8'))
+        except json.JSONDecodeError:
+            print(f"Warning: checkpoint {checkpoint_path} is corrupt, starting fresh.")
+    return {}
+
+
+def write_json_atomic(path, data):
+    """Writes JSON through a temporary file so a crash never leaves a half-written file."""
+    tmp_path = path.with_name(path.name + ".tmp")
+    tmp_path.write_text(json.dumps(data, indent=4), encoding='utf-8')
+    tmp_path.replace(path)
+
+
+def run_batch(topics, llm_concurrency, render_concurrency, checkpoint_path, manifest_path, duplicates=None):
+    """
+    Generates every pending topic and returns the results keyed by topic.
+    Skipped duplicates ({topic: kept_topic}) are listed in the manifest.
+    """
+    duplicates = duplicates or {}
+    results = load_checkpoint(checkpoint_path)
+    cache = video_generator.load_cache()
+
+    pending = []
+    for topic in topics:
+        if results.get(topic, {}).get("status") in ("generated", "cached"):
+            continue
+        cached_parts = find_cached_video(topic, cache)
+        if cached_parts:
+            results[topic] = {
+                "status": "cached",
+                "video_url": "/videos/" + "/".join(cached_parts),
+            }
+            continue
+        pending.append(topic)
+
+    print(f"{len(topics)} topics, {len(topics) - len(pending)} already done, {len(pending)} to generate.")
+    write_json_atomic(checkpoint_path, results)
+
+    llm_slots = threading.BoundedSemaphore(llm_concurrency)
+    render_slots = threading.BoundedSemaphore(render_concurrency)
+    checkpoint_lock = threading.Lock()
+
+    def generate(topic):
+        started = time.monotonic()
+        try:
+            path_parts, _ = video_generator.generate_video_process(
+                topic,
+                video_generator.sanitize_topic_module(topic),
+                llm_slots=llm_slots,
+                render_slots=render_slots,
+                preview=False, # No player to open on a headless batch host
+            )
+            result = {"status": "generated", "video_url": "/videos/" + "/".join(str(p) for p in path_parts)}
+        except Exception as e:
+            traceback.print_exc()
+            result = {"status": "failed", "error": str(e)}
+        result["elapsed_seconds"] = round(time.monotonic() - started, 1)
+        return result
+
+    # Enough workers that scripts for the next topics can be written while others render
+    with ThreadPoolExecutor(max_workers=max(1, llm_concurrency + render_concurrency)) as executor:
+        futures = {executor.submit(generate, topic): topic for topic in pending}
+        try:
+            for done_count, future in enumerate(as_completed(futures), start=1):
+                topic = futures[future]
+                with checkpoint_lock:
+                    results[topic] = future.result()
+                    write_json_atomic(checkpoint_path, results)
+                print(f"[{done_count}/{len(pending)}] {topic}: {results[topic]['status']}")
+        except KeyboardInterrupt:
+            # Drop queued topics and wait only for the ones already running; the checkpoint lets a re-run resume
+            print("Interrupted, waiting for running topics to finish. Re-run the same command to resume.")
+            executor.shutdown(wait=True, cancel_futures=True)
+            raise
+
+    manifest = [{"topic": topic, **results[topic]} for topic in topics if topic in results]
+    manifest += [{"topic": topic, "status": "duplicate", "duplicate_of": kept} for topic, kept in duplicates.items()]
+    write_json_atomic(manifest_path, manifest)
+    print(f"Manifest written to {manifest_path}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-generate videos for a list of topics.")
+    parser.add_argument("input", type=Path, help="JSONL file with one topic per line")
+    parser.add_argument("--llm-concurrency", type=int, default=2, help="Max concurrent Gemini calls")
+    parser.add_argument("--render-concurrency", type=int, default=1, help="Max concurrent Manim renders")
+    parser.add_argument("--checkpoint", type=Path, default=DEFAULT_CHECKPOINT, help="Progress file used to resume")
+    parser.add_argument("--manifest", type=Path, default=DEFAULT_MANIFEST, help="Where to write the results manifest")
+    parser.add_argument("--fresh", action="store_true", help="Ignore an existing checkpoint")
+    args = parser.parse_args()
+    config.load_config()
+
+    if args.llm_concurrency < 1 or args.render_concurrency < 1:
+        parser.error("concurrency limits must be at least 1")
+    if args.fresh and args.checkpoint.exists():
+        args.checkpoint.unlink()
+
+    topics, duplicates = read_topics(args.input)
+    results = run_batch(
+        topics,
+        args.llm_concurrency,
+        args.render_concurrency,
+        args.checkpoint,
+        args.manifest,
+        duplicates,
+    )
+    failed = [topic for topic in topics if results[topic]["status"] == "failed"]
+    if failed:
+        print(f"{len(failed)} topics failed; re-run the same command to retry them.")
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""
+Startup profile for the API server.
+
+Reports where import time goes when a worker loads `server` (from `python -X importtime`)
+and measures worker startup latency: importing the module and building the app with
+create_app(), in a fresh interpreter each run.
+
+Usage:
+    python benchmarks/startup_profile.py --runs 10 --top 15 --json startup_profile.json
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+
+STARTUP_SNIPPET = (
+    "import time; t = time.perf_counter(); "
+    "import {module}; {module}.create_app() if hasattr({module}, 'create_app') else None; "
+    "print(time.perf_counter() - t)"
+)
+
+
+def import_breakdown(module):
+    """
+    Runs `python -X importtime -c "import <module>"` and returns the module's cumulative
+    import time in ms and [(package, self_ms, cumulative_ms)] for each module it imports directly.
+    """
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, cwd=REPO_DIR,
+    )
+    if process.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{process.stderr.strip()[-2000:]}")
+
+    # importtime lists children before their parent, indented two spaces per level
+    children = []
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        row = (name.strip(), int(self_us) / 1000, int(cumulative_us) / 1000)
+        if depth == 1:
+            children.append(row)
+        elif depth == 0:
+            if row[0] == module:
+                return row[2], children
+            children = []
+    raise RuntimeError(f"No import timing found for {module}")
+
+
+def startup_latency(module, runs):
+    """Seconds spent importing the module and building the app, one fresh interpreter per run."""
+    samples = []
+    for _ in range(runs):
+        process = subprocess.run(
+            [sys.executable, "-c", STARTUP_SNIPPET.format(module=module)],
+            capture_output=True, text=True, cwd=REPO_DIR,
+        )
+        if process.returncode != 0:
+            raise RuntimeError(f"Starting {module} failed:\n{process.stderr.strip()[-2000:]}")
+        samples.append(float(process.stdout.strip().splitlines()[-1]))
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Profile server import time and worker startup latency.")
+    parser.add_argument("--module", default="server", help="Module a worker imports (default: server)")
+    parser.add_argument("--runs", type=int, default=10, help="Fresh-interpreter startups to time")
+    parser.add_argument("--top", type=int, default=15, help="Number of slowest imports to list")
+    parser.add_argument("--json", type=Path, help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    total_ms, children = import_breakdown(args.module)
+
+    print(f"Import-time breakdown for '{args.module}' ({total_ms:.1f} ms total)")
+    print(f"{'cumulative ms':>14} {'self ms':>9}  package")
+    top_level = sorted(children, key=lambda r: r[2], reverse=True)
+    for name, self_ms, cumulative_ms in top_level[:args.top]:
+        print(f"{cumulative_ms:14.1f} {self_ms:9.1f}  {name}")
+
+    samples = startup_latency(args.module, args.runs)
+    samples_ms = sorted(s * 1000 for s in samples)
+    p95_ms = samples_ms[min(len(samples_ms) - 1, int(round(0.95 * (len(samples_ms) - 1))))]
+    print(f"\nWorker startup latency over {args.runs} runs: "
+          f"median {statistics.median(samples_ms):.1f} ms, p95 {p95_ms:.1f} ms, "
+          f"min {samples_ms[0]:.1f} ms, max {samples_ms[-1]:.1f} ms")
+
+    if args.json:
+        args.json.write_text(json.dumps({
+            "module": args.module,
+            "import_total_ms": round(total_ms, 1),
+            "imports": [
+                {"package": name, "self_ms": round(self_ms, 2), "cumulative_ms": round(cumulative_ms, 2)}
+                for name, self_ms, cumulative_ms in top_level
+            ],
+            "startup_latency_ms": {
+                "runs": args.runs,
+                "median": round(statistics.median(samples_ms), 1),
+                "p95": round(p95_ms, 1),
+                "min": round(samples_ms[0], 1),
+                "max": round(samples_ms[-1], 1),
+            },
+        }, indent=4), encoding='utf-8')
+        print(f"Results written to {args.json}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,5 @@
 import os
 from pathlib import Path
-from dotenv import load_dotenv
-
-# Load environment variables
-load_dotenv()
 
 # Base paths
 BASE_DIR = Path(__file__).parent
@@ -16,17 +12,13 @@ MANIM_SCRIPTS_DIR = TEMP_DIR / "manim_scripts"
 AUDIO_FILES_DIR = TEMP_DIR / "audio_files"
 VIDEO_FILES_DIR = TEMP_DIR / "video_files"
 
-# Create directories if they don't exist
-for directory in [PROMPTS_DIR, MANIM_SCRIPTS_DIR, AUDIO_FILES_DIR, VIDEO_FILES_DIR, OUTPUT_DIR]:
-    directory.mkdir(parents=True, exist_ok=True)
-
 # API Configuration
 
 # --- API Configuration ---
 # This is the central spot for your API settings.
 API_CONFIG = {
-    # It's crucial that your API_KEY is set in the .env file.
-    "api_key": os.getenv("API_KEY"),
+    # It's crucial that your API_KEY is set in the .env file. Filled in by load_config().
+    "api_key": None,
     
     # We specify the model here for easy swapping in the future.
     "model": "gemini-2.5-flash-preview-05-20",
@@ -45,3 +37,23 @@ MANIM_CONFIG = {
 }
 
 
+_loaded = False
+
+def load_config():
+    """
+    Loads the .env file and creates the working directories.
+    Called once by the app factory (or CLI entry point) instead of on import,
+    so importing this module stays cheap.
+    """
+    global _loaded
+    if _loaded:
+        return
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    API_CONFIG["api_key"] = os.getenv("API_KEY")
+
+    # Create directories if they don't exist
+    for directory in [PROMPTS_DIR, MANIM_SCRIPTS_DIR, AUDIO_FILES_DIR, VIDEO_FILES_DIR, OUTPUT_DIR]:
+        directory.mkdir(parents=True, exist_ok=True)
+    _loaded = True
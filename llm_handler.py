@@ -1,21 +1,35 @@
 import os
-import google.generativeai as genai
-from dotenv import load_dotenv
+import threading
 
 # It's recommended to set the API key as an environment variable for security
-load_dotenv()
 GOOGLE_API_KEY = "" """Give your Gemini API key"""
 
-# Warn if key is missing; do not hardcode in code
-if not GOOGLE_API_KEY:
-    print("Warning: GOOGLE_API_KEY / GEMINI_API_KEY not found in environment. LLM features may fail.")
-else:
-    genai.configure(api_key=GOOGLE_API_KEY)
+_genai = None
+_genai_lock = threading.Lock()
+
+def get_genai():
+    """
+    Imports and configures the Gemini SDK on first use.
+    The SDK is slow to import, so processes that never call the LLM don't pay for it.
+    """
+    global _genai
+    with _genai_lock:
+        if _genai is None:
+            import google.generativeai as genai
+
+            api_key = GOOGLE_API_KEY or os.getenv("GOOGLE_API_KEY") or os.getenv("GEMINI_API_KEY")
+            # Warn if key is missing; do not hardcode in code
+            if not api_key:
+                print("Warning: GOOGLE_API_KEY / GEMINI_API_KEY not found in environment. LLM features may fail.")
+            else:
+                genai.configure(api_key=api_key)
+            _genai = genai
+    return _genai
 
 class LLMHandler:
     """Handles interaction with the Gemini LLM for generating and fixing Manim scripts."""
     def __init__(self):
-        self.model = genai.GenerativeModel('gemini-2.5-flash')
+        self.model = get_genai().GenerativeModel('gemini-2.5-flash')
 
     def _get_system_prompt(self, class_name):
         """Generates a detailed system prompt to guide the LLM."""
@@ -4,10 +4,26 @@ import traceback
 import shutil
 from pathlib import Path
 import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 import llm_handler # Assumes llm_handler.py is in the same directory
+import transcripts
+import previews
+import render_policy
 
 CACHE_FILE = Path("generation_cache.json")
 
+# Guards read-modify-write cycles on the cache file when several generations run at once
+_cache_lock = threading.Lock()
+
+# Returned by run_manim_process when Manim is stopped for exceeding its timeout
+TIMEOUT_RETURN_CODE = -2
+
+# Background re-renders of popular videos run one at a time
+_upgrade_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="quality-upgrade")
+_upgrades_in_progress = set()
+
 def load_cache():
     """Loads the generation cache from a JSON file."""
     if CACHE_FILE.exists():
@@ -19,20 +35,49 @@ def load_cache():
     return {}
 
 def save_to_cache(key, data, cache):
-    """Saves a new entry to the cache and writes it to the file."""
-    cache[key] = data
-    with open(CACHE_FILE, 'w') as f:
-        json.dump(cache, f, indent=4)
+    """
+    Saves a new entry to the cache and writes it to the file.
+    The file is re-read under a lock so entries written by concurrent generations in this
+    process are kept, and written through a temporary file so readers never see it half-written.
+    Two processes writing at the same moment (e.g. a batch run and the server) are not
+    protected from each other; the last writer wins.
+    """
+    with _cache_lock:
+        cache.update(load_cache())
+        cache[key] = data
+        tmp_path = CACHE_FILE.with_name(CACHE_FILE.name + ".tmp")
+        with open(tmp_path, 'w') as f:
+            json.dump(cache, f, indent=4)
+        tmp_path.replace(CACHE_FILE)
+
+def find_cache_entry(sanitized_topic_module, cache):
+    """
+    Returns (topic, entry) for the cache entry that renders into `generated_<module>`,
+    or (None, None). Topics that differ only in case or punctuation share one entry.
+    """
+    script_name = f"generated_{sanitized_topic_module}"
+    for topic, entry in cache.items():
+        if entry["video_path_parts"][0] == script_name:
+            return topic, entry
+    return None, None
+
+def sanitize_topic_module(topic):
+    """Turns a topic into a valid Python module name (e.g., "fourier_transform")."""
+    return re.sub(r'[^a-zA-Z0-9_]', '', topic.replace(' ', '_')).lower()
 
-def parse_srt(file_path):
-    """Parses a .srt file and returns the clean transcript text."""
+def parse_srt(file_path, video_id=None):
+    """
+    Parses a .srt file and returns the clean transcript text.
+    If a video_id is given, the timed cues are also saved to the transcript store.
+    """
     if not file_path.exists():
         print(f"Warning: SRT file not found at {file_path}")
         return "Transcript not found."
-    content = file_path.read_text(encoding='utf-8')
-    # Use regex to strip timestamps and line numbers, then join lines
-    text_only = re.sub(r'\d+\n\d{2}:\d{2}:\d{2},\d{3} --> \d{2}:\d{2}:\d{2},\d{3}\n', '', content)
-    return text_only.replace('\n', ' ').strip()
+    if video_id:
+        cues = transcripts.ingest_srt(video_id, file_path)
+    else:
+        cues = transcripts.parse_srt_cues(file_path.read_text(encoding='utf-8'))
+    return transcripts.transcript_text(cues)
 
 def find_scene_class_name(script_content):
     """Finds any class name that inherits from VoiceoverScene in the script."""
@@ -41,9 +86,44 @@ def find_scene_class_name(script_content):
         return match.group(1)
     raise ValueError("Could not find a 'class YourSceneName(VoiceoverScene):' in the Manim script.")
 
-def run_manim_process(command):
+def build_manim_command(script_path, scene_class_name, quality, preview=True):
+    """Builds the Manim CLI command for a quality level and returns it with the output folder name."""
+    quality_flag, resolution_dir = render_policy.quality_settings(quality)
+    flags = f"-pq{quality_flag}" if preview else f"-q{quality_flag}"
+    command = [
+        "manim", flags, str(script_path), scene_class_name, "--disable_caching"
+    ]
+    return command, resolution_dir
+
+def trim_to_budget(llm, script_content, trims_left, llm_slots=None):
+    """
+    Asks the LLM to shorten a script that is over the duration budget, using at most
+    `trims_left` LLM calls. A script that is still over budget afterwards is rendered anyway.
+    Returns (script_content, trims_left).
+    """
+    llm_slots = llm_slots or nullcontext()
+    while True:
+        budget_error = render_policy.check_duration_budget(script_content)
+        if not budget_error:
+            return script_content, trims_left
+        if trims_left == 0:
+            estimate = render_policy.estimate_duration(script_content)
+            if estimate > render_policy.MAX_SECONDS:
+                print(f"Warning: duration overrun, script is ~{estimate:.0f}s "
+                      f"(ceiling {render_policy.MAX_SECONDS}s) after trimming; rendering it anyway.")
+            else:
+                print(f"Script is ~{estimate:.0f}s after trimming, above the "
+                      f"{render_policy.TARGET_SECONDS}s target; rendering it anyway.")
+            return script_content, trims_left
+        print(f"Script is over the duration budget, asking the LLM to trim it: {budget_error}")
+        with llm_slots:
+            script_content = llm.fix_code(script_content, budget_error)
+        trims_left -= 1
+
+def run_manim_process(command, timeout=300):
     """
     Runs the Manim command, captures its output, and enforces a timeout to prevent freezes.
+    A timeout is reported with TIMEOUT_RETURN_CODE so callers can tell it apart from a script error.
     """
     try:
         # Using subprocess.run is a simpler way to handle timeouts and capture output
@@ -52,7 +132,7 @@ def run_manim_process(command):
             capture_output=True,
             text=True,
             encoding='utf-8',
-            timeout=300  # 5-minute timeout
+            timeout=timeout
         )
         
         # Print captured output for debugging
@@ -63,18 +143,26 @@ def run_manim_process(command):
         return process.returncode, process.stdout, process.stderr
 
     except subprocess.TimeoutExpired as e:
-        print("[Manim ERROR]: Process timed out after 5 minutes. It was likely stuck on a network request or complex animation.")
-        return -1, e.stdout or "", e.stderr or "Manim process timed out and was terminated."
+        print(f"[Manim ERROR]: Process timed out after {timeout} seconds. It was likely stuck on a network request or complex animation.")
+        return TIMEOUT_RETURN_CODE, e.stdout or "", f"Manim process timed out after {timeout} seconds and was terminated."
 
     except Exception as e:
         print(f"[Manim ERROR]: An unexpected error occurred while running the Manim process: {e}")
         return -1, "", str(e)
 
 
-def generate_video_process(topic, sanitized_topic_module):
+def generate_video_process(topic, sanitized_topic_module, llm_slots=None, render_slots=None, preview=True,
+                           max_quality=None):
     """ 
     Orchestrates the entire video generation pipeline with a retry/fix and caching mechanism.
+    `llm_slots` and `render_slots` are optional semaphores that bound how many Gemini calls
+    and Manim renders run at once when several topics are generated concurrently.
+    `preview=False` stops Manim from opening a player after rendering (for headless runs).
+    `max_quality` caps the render quality below the configured one (e.g. for interactive requests).
     """
+    llm_slots = llm_slots or nullcontext()
+    render_slots = render_slots or nullcontext()
+
     # --- FFmpeg Check ---
     if shutil.which("ffmpeg") is None:
         raise RuntimeError(
@@ -109,16 +197,30 @@ def generate_video_process(topic, sanitized_topic_module):
     
     manim_script_content = None
     last_error = ""
+    trims_left = render_policy.MAX_TRIM_ATTEMPTS
+    quality_ceiling = max_quality or render_policy.max_quality()
+    # Set after a timeout: render the same script again at a lower quality without asking the LLM
+    rerender = False
     
     # Retry loop (up to 2 attempts)
     for attempt in range(4):
         try:
-            if attempt == 0:
-                print("Generating initial Manim script with Gemini...")
-                manim_script_content = llm.generate_content(topic, sanitized_topic_class)
-            else: # This is a retry attempt
-                print(f"\n--- RETRY ATTEMPT {attempt} ---")
-                manim_script_content = llm.fix_code(manim_script_content, last_error)
+            if rerender:
+                print(f"\n--- RETRY ATTEMPT {attempt}: same script at {quality_ceiling} ---")
+                rerender = False
+            else:
+                with llm_slots:
+                    if attempt == 0:
+                        print("Generating initial Manim script with Gemini...")
+                        manim_script_content = llm.generate_content(topic, sanitized_topic_class)
+                    else: # This is a retry attempt
+                        print(f"\n--- RETRY ATTEMPT {attempt} ---")
+                        manim_script_content = llm.fix_code(manim_script_content, last_error)
+
+                # Trim over-long scripts before they take up a render slot; this has its own retry budget
+                manim_script_content, trims_left = trim_to_budget(
+                    llm, manim_script_content, trims_left, llm_slots
+                )
 
             script_path.write_text(manim_script_content, encoding='utf-8')
             print(f"Manim script saved to {script_path}")
@@ -126,21 +228,28 @@ def generate_video_process(topic, sanitized_topic_module):
             scene_class_name = find_scene_class_name(manim_script_content)
             print(f"Found Manim scene class: {scene_class_name}")
 
-            manim_command = [
-                "manim", "-pql", str(script_path), scene_class_name, "--disable_caching"
-            ]
-            
-            print(f"\n--- Running Manim (Attempt {attempt + 1}) ---")
-            print(f"Command: {' '.join(manim_command)}\n")
-            
-            return_code, stdout, stderr = run_manim_process(manim_command)
+            with render_policy.tracked_render(), render_slots:
+                # Other renders in flight, not counting this one
+                quality = render_policy.choose_quality(
+                    depth=render_policy.queue_depth() - 1, ceiling=quality_ceiling
+                )
+                manim_command, resolution_dir = build_manim_command(
+                    script_path, scene_class_name, quality, preview=preview
+                )
+
+                print(f"\n--- Running Manim (Attempt {attempt + 1}, {quality}) ---")
+                print(f"Command: {' '.join(manim_command)}\n")
+
+                return_code, stdout, stderr = run_manim_process(
+                    manim_command, timeout=render_policy.render_timeout(quality)
+                )
             
             print("\n--- Manim Finished ---")
             
             if return_code == 0:
                 print("Manim rendering completed successfully.")
                 
-                media_dir = Path.cwd() / "media" / "videos" / script_name / "480p15"
+                media_dir = Path.cwd() / "media" / "videos" / script_name / resolution_dir
                 video_file = media_dir / f"{scene_class_name}.mp4"
                 srt_file = media_dir / f"{scene_class_name}.srt"
 
@@ -150,13 +259,18 @@ def generate_video_process(topic, sanitized_topic_module):
                 print(f"Found video file: {video_file}")
                 print(f"Found SRT file: {srt_file}")
 
-                transcript = parse_srt(srt_file)
-                video_path_parts = [script_name, "480p15", f"{scene_class_name}.mp4"]
+                transcript = parse_srt(srt_file, sanitized_topic_module)
+                # Poster and sprite sheet are extracted in the background
+                previews.schedule_previews(video_file)
+                video_path_parts = [script_name, resolution_dir, f"{scene_class_name}.mp4"]
 
                 # --- Save to Cache on Success ---
+                # The script is kept so popular videos can be re-rendered at higher quality later
                 new_cache_entry = {
                     "video_path_parts": video_path_parts,
-                    "transcript": transcript
+                    "transcript": transcript,
+                    "quality": quality,
+                    "script": manim_script_content
                 }
                 save_to_cache(topic, new_cache_entry, cache)
                 print(f"--- Saved '{topic}' to cache. ---")
@@ -166,6 +280,16 @@ def generate_video_process(topic, sanitized_topic_module):
                 
                 return video_path_parts, transcript
 
+            elif return_code == TIMEOUT_RETURN_CODE:
+                # Too slow for this quality, not a script bug, so it is not sent to the LLM
+                lower = render_policy.lower_quality(quality)
+                if lower is None:
+                    last_error = stderr
+                    break
+                print(f"Manim timed out at {quality}; rendering the same script at {lower}.")
+                quality_ceiling = lower
+                rerender = True
+
             else:
                 print(f"Manim failed with return code {return_code}.")
                 last_error = stderr or stdout 
@@ -181,3 +305,68 @@ def generate_video_process(topic, sanitized_topic_module):
     
     raise RuntimeError(f"Manim failed after all retry attempts. Last error: {last_error}")
 
+
+
+def upgrade_video_quality(topic):
+    """
+    Re-renders a cached video at the configured quality, keeping the lower-quality file in place
+    until the new one is ready. Returns the new video path parts, or None if nothing was done.
+    """
+    cache = load_cache()
+    entry = cache.get(topic)
+    if not entry or "script" not in entry:
+        return None
+    target = render_policy.max_quality()
+    current = entry.get("quality", "low_quality")
+    if render_policy.QUALITY_NAMES.index(current) >= render_policy.QUALITY_NAMES.index(target):
+        return None
+
+    script_name = entry["video_path_parts"][0]
+    script_path = Path(f"{script_name}.py")
+    script_path.write_text(entry["script"], encoding='utf-8')
+    try:
+        scene_class_name = find_scene_class_name(entry["script"])
+        manim_command, resolution_dir = build_manim_command(
+            script_path, scene_class_name, target, preview=False
+        )
+        print(f"--- Upgrading '{topic}' from {current} to {target} ---")
+        with render_policy.tracked_render():
+            return_code, stdout, stderr = run_manim_process(
+                manim_command, timeout=render_policy.render_timeout(target)
+            )
+        video_file = Path.cwd() / "media" / "videos" / script_name / resolution_dir / f"{scene_class_name}.mp4"
+        if return_code != 0 or not video_file.exists():
+            print(f"Quality upgrade for '{topic}' failed: {stderr or stdout}")
+            return None
+    finally:
+        if script_path.exists():
+            script_path.unlink()
+
+    previews.schedule_previews(video_file)
+    entry["video_path_parts"] = [script_name, resolution_dir, video_file.name]
+    entry["quality"] = target
+    save_to_cache(topic, entry, cache)
+    print(f"--- Upgraded '{topic}' to {target}. ---")
+    return entry["video_path_parts"]
+
+def _run_upgrade(topic):
+    try:
+        upgrade_video_quality(topic)
+    except Exception:
+        traceback.print_exc()
+    finally:
+        _upgrades_in_progress.discard(topic)
+
+def schedule_quality_upgrade(sanitized_topic_module):
+    """
+    Queues a background re-render of a video at the configured quality.
+    Skipped while other renders are running so upgrades only use idle capacity.
+    """
+    if render_policy.queue_depth() > 0:
+        return False
+    topic, _ = find_cache_entry(sanitized_topic_module, load_cache())
+    if topic is None or topic in _upgrades_in_progress:
+        return False
+    _upgrades_in_progress.add(topic)
+    _upgrade_executor.submit(_run_upgrade, topic)
+    return True
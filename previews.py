@@ -0,0 +1,178 @@
+"""
+Poster frames and preview sprite sheets for rendered videos.
+
+After a render, a single FFmpeg pass extracts a poster frame and a low-resolution sprite
+sheet: a grid of frames spread evenly over the whole video, so the sampling interval grows
+with the video's length. The interval is recorded in the sprite's file name
+(`<Scene>_sprite_<hash>_<interval ms>ms.jpg`). Both images are named after a hash
+of the video's content and written next to the MP4, so they are served by the existing
+/videos/ route and change URL whenever the video does. The work runs on a small background
+pool so it never holds up the render that triggered it.
+"""
+import hashlib
+import shutil
+import re
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+POSTER_WIDTH = 480
+POSTER_TIME = 1  # seconds into the video, past the initial blank frame
+SPRITE_TILE_WIDTH = 160
+SPRITE_COLUMNS = 5
+SPRITE_ROWS = 2
+DEFAULT_SPRITE_INTERVAL = 3  # seconds between sprite frames when the duration cannot be probed
+
+# At most this many FFmpeg preview processes run at once, each limited to one thread
+MAX_WORKERS = 1
+
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="previews")
+_pending = set()
+_failed = {}  # video path -> mtime of the file FFmpeg could not handle; retried once the file changes
+_pending_lock = threading.Lock()
+
+
+def content_hash(video_path):
+    """Returns a short SHA-256 digest of the video file's bytes."""
+    digest = hashlib.sha256()
+    with open(video_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+def probe_duration(video_path):
+    """Returns the video's duration in seconds using ffprobe, or None if it cannot be read."""
+    if shutil.which("ffprobe") is None:
+        return None
+    try:
+        process = subprocess.run(
+            ["ffprobe", "-v", "error", "-show_entries", "format=duration",
+             "-of", "default=noprint_wrappers=1:nokey=1", str(video_path)],
+            capture_output=True, text=True, timeout=30,
+        )
+        return float(process.stdout.strip())
+    except (subprocess.TimeoutExpired, ValueError):
+        return None
+
+
+def sprite_interval(sprite_path):
+    """Reads the seconds between sprite frames from a sprite sheet's file name."""
+    match = re.search(r'_(\d+)ms$', Path(sprite_path).stem)
+    return int(match.group(1)) / 1000 if match else DEFAULT_SPRITE_INTERVAL
+
+
+def _latest(folder, pattern):
+    matches = sorted(folder.glob(pattern), key=lambda p: p.stat().st_mtime, reverse=True)
+    return matches[0] if matches else None
+
+
+def find_previews(video_path):
+    """
+    Returns {"poster": Path, "sprite": Path, "interval": seconds} for the newest previews
+    of a video, or None if they have not been generated yet.
+    """
+    video_path = Path(video_path)
+    poster = _latest(video_path.parent, f"{video_path.stem}_poster_*.jpg")
+    sprite = _latest(video_path.parent, f"{video_path.stem}_sprite_*.jpg")
+    if poster is None or sprite is None:
+        return None
+    return {"poster": poster, "sprite": sprite, "interval": sprite_interval(sprite)}
+
+
+def generate_previews(video_path):
+    """Extracts the poster and sprite sheet for a video in one FFmpeg pass."""
+    video_path = Path(video_path)
+    if shutil.which("ffmpeg") is None:
+        print("Warning: FFmpeg not found, skipping preview generation.")
+        return None
+
+    # Spread the tiles over the whole video rather than only its first few seconds
+    duration = probe_duration(video_path)
+    tiles = SPRITE_COLUMNS * SPRITE_ROWS
+    interval = duration / tiles if duration else DEFAULT_SPRITE_INTERVAL
+    interval_ms = max(1, int(interval * 1000))
+
+    video_hash = content_hash(video_path)
+    poster = video_path.with_name(f"{video_path.stem}_poster_{video_hash}.jpg")
+    sprite = video_path.with_name(f"{video_path.stem}_sprite_{video_hash}_{interval_ms}ms.jpg")
+    if poster.exists() and sprite.exists():
+        return {"poster": poster, "sprite": sprite, "interval": interval_ms / 1000}
+
+    # Write to temporary names so a half-finished file is never picked up by find_previews
+    poster_tmp = poster.with_name(f"tmp_{poster.name}")
+    sprite_tmp = sprite.with_name(f"tmp_{sprite.name}")
+    filter_graph = (
+        f"[0:v]split=2[p][s];"
+        f"[p]trim=start={POSTER_TIME},scale={POSTER_WIDTH}:-2[poster];"
+        f"[s]fps=1000/{interval_ms},scale={SPRITE_TILE_WIDTH}:-2,tile={SPRITE_COLUMNS}x{SPRITE_ROWS}[sprite]"
+    )
+    command = [
+        "ffmpeg", "-y", "-v", "error", "-threads", "1",
+        "-i", str(video_path),
+        "-filter_complex", filter_graph,
+        "-map", "[poster]", "-frames:v", "1", "-q:v", "4", str(poster_tmp),
+        "-map", "[sprite]", "-frames:v", "1", "-q:v", "6", str(sprite_tmp),
+    ]
+    try:
+        process = subprocess.run(command, capture_output=True, text=True, timeout=120)
+    except subprocess.TimeoutExpired:
+        print(f"[Previews ERROR]: FFmpeg timed out for {video_path}")
+        return None
+    if process.returncode != 0 or not poster_tmp.exists() or not sprite_tmp.exists():
+        print(f"[Previews ERROR]: FFmpeg failed for {video_path}: {process.stderr.strip()}")
+        poster_tmp.unlink(missing_ok=True)
+        sprite_tmp.unlink(missing_ok=True)
+        return None
+
+    poster_tmp.replace(poster)
+    sprite_tmp.replace(sprite)
+
+    # Drop previews left over from an earlier render of this video
+    for stale in video_path.parent.glob(f"{video_path.stem}_*_*.jpg"):
+        if stale not in (poster, sprite):
+            stale.unlink(missing_ok=True)
+
+    print(f"Generated previews for {video_path.name}")
+    return {"poster": poster, "sprite": sprite, "interval": interval_ms / 1000}
+
+
+def _mtime(video_path):
+    try:
+        return Path(video_path).stat().st_mtime
+    except OSError:
+        return None
+
+
+def _run(video_path):
+    result = None
+    try:
+        result = generate_previews(video_path)
+    except Exception as e:
+        print(f"[Previews ERROR]: Could not generate previews for {video_path}: {e}")
+    finally:
+        with _pending_lock:
+            _pending.discard(str(video_path))
+            # A missing FFmpeg is not the file's fault; try again once it is installed
+            if result is None and shutil.which("ffmpeg") is not None:
+                _failed[str(video_path)] = _mtime(video_path)
+    return result
+
+
+def schedule_previews(video_path):
+    """
+    Queues preview generation in the background.
+    Requests for a video that is already queued, or whose current file previously failed,
+    are ignored. A file re-rendered at the same path is tried again.
+    """
+    key = str(video_path)
+    with _pending_lock:
+        if key in _pending:
+            return
+        if key in _failed:
+            if _failed[key] == _mtime(video_path):
+                return
+            del _failed[key]
+        _pending.add(key)
+    _executor.submit(_run, video_path)
@@ -0,0 +1,250 @@
+"""
+Render quality and duration budget decisions.
+
+Quality follows demand: renders use the quality set in MANIM_CONFIG when the host is idle
+and step down as the render queue or CPU load grows. Scripts are checked against the
+narration time budget before rendering so over-long scenes go back to the LLM for trimming
+before they occupy a render slot. Videos that get watched often are re-rendered later at
+the configured quality.
+"""
+import ast
+import os
+import threading
+from contextlib import contextmanager
+
+import transcripts
+from config import MANIM_CONFIG
+
+# Manim quality names, their CLI flag and the output folder Manim renders into, lowest first
+QUALITIES = [
+    ("low_quality", "l", "480p15"),
+    ("medium_quality", "m", "720p30"),
+    ("high_quality", "h", "1080p60"),
+]
+QUALITY_NAMES = [name for name, _, _ in QUALITIES]
+
+# Manim timeout in seconds for each quality; higher resolutions and frame rates take longer
+RENDER_TIMEOUTS = {
+    "low_quality": 300,
+    "medium_quality": 600,
+    "high_quality": 1200,
+}
+
+# Interactive requests render at most at this quality so users are not kept waiting on a
+# full-quality render; popular videos reach the configured quality via the background upgrade
+INTERACTIVE_MAX_QUALITY = "medium_quality"
+
+# Step down to medium quality once this many renders are in flight, and to low at the next level
+MEDIUM_QUEUE_DEPTH = 1
+LOW_QUEUE_DEPTH = 2
+# Same thresholds for the 1-minute load average per CPU core
+MEDIUM_LOAD = 0.6
+LOW_LOAD = 1.0
+
+# Duration budget, matching the 28-second target in the LLM system prompt. Scripts estimated
+# over TRIM_ABOVE_SECONDS (the target plus a small tolerance for estimation error) are sent
+# back for trimming up to MAX_TRIM_ATTEMPTS times. A script still over afterwards is rendered
+# anyway rather than failing the request; beyond MAX_SECONDS that is logged as an overrun.
+TARGET_SECONDS = 28
+TRIM_ABOVE_SECONDS = 35
+MAX_SECONDS = 60
+MAX_TRIM_ATTEMPTS = 2
+TRANSITION_SECONDS = 1.0  # fade-outs and pauses between voiceover blocks
+
+# Narration pace used until enough rendered transcripts exist to measure it (gTTS English
+# speaks about 170 words per minute)
+DEFAULT_WORDS_PER_SECOND = 2.9
+# Rendered videos needed before the pace is taken from their SRT cue timings instead
+MIN_CALIBRATION_VIDEOS = 3
+
+# A video is queued for a higher-quality re-render every this many detail views
+UPGRADE_VIEWS = 5
+
+_lock = threading.Lock()
+_active_renders = 0
+_views = {}
+_words_per_second = None
+
+
+def quality_settings(quality):
+    """Returns (flag, resolution_dir) for a Manim quality name."""
+    for name, flag, resolution_dir in QUALITIES:
+        if name == quality:
+            return flag, resolution_dir
+    raise ValueError(f"Unknown Manim quality '{quality}'. Expected one of {QUALITY_NAMES}.")
+
+
+def max_quality():
+    """The configured quality, used when the host has spare capacity."""
+    quality = MANIM_CONFIG.get("quality", "low_quality")
+    quality_settings(quality)
+    return quality
+
+
+def render_timeout(quality):
+    """Seconds a Manim render at this quality may run before it is stopped."""
+    return RENDER_TIMEOUTS[quality]
+
+
+def lower_quality(quality):
+    """The next quality level down, or None if this is already the lowest."""
+    index = QUALITY_NAMES.index(quality)
+    return QUALITY_NAMES[index - 1] if index > 0 else None
+
+
+def resolution_dirs():
+    """Output folder names ordered from best to worst quality."""
+    return [resolution_dir for _, _, resolution_dir in reversed(QUALITIES)]
+
+
+def quality_for_resolution_dir(resolution_dir):
+    for name, _, folder in QUALITIES:
+        if folder == resolution_dir:
+            return name
+    return None
+
+
+def host_load():
+    """1-minute load average per CPU core, or None where the OS does not report it (e.g. Windows)."""
+    try:
+        return os.getloadavg()[0] / (os.cpu_count() or 1)
+    except (AttributeError, OSError):
+        return None
+
+
+def queue_depth():
+    """Number of renders currently waiting for or holding a render slot."""
+    return _active_renders
+
+
+@contextmanager
+def tracked_render():
+    """Counts a render towards the queue depth for as long as the block runs."""
+    global _active_renders
+    with _lock:
+        _active_renders += 1
+    try:
+        yield
+    finally:
+        with _lock:
+            _active_renders -= 1
+
+
+def choose_quality(depth=None, load=None, ceiling=None):
+    """
+    Picks a Manim quality from the render queue depth and host load, capped at the configured
+    quality and, if given, at `ceiling`.
+    """
+    depth = queue_depth() if depth is None else depth
+    load = host_load() if load is None else load
+    load = load or 0.0
+
+    if depth >= LOW_QUEUE_DEPTH or load >= LOW_LOAD:
+        wanted = "low_quality"
+    elif depth >= MEDIUM_QUEUE_DEPTH or load >= MEDIUM_LOAD:
+        wanted = "medium_quality"
+    else:
+        wanted = max_quality()
+    cap = QUALITY_NAMES.index(max_quality())
+    if ceiling is not None:
+        cap = min(cap, QUALITY_NAMES.index(ceiling))
+    return QUALITY_NAMES[min(QUALITY_NAMES.index(wanted), cap)]
+
+
+def words_per_second():
+    """
+    Narration pace measured from the cue timings of rendered videos' SRT files
+    (words spoken / seconds of speech), computed once per process.
+    Falls back to DEFAULT_WORDS_PER_SECOND until MIN_CALIBRATION_VIDEOS have been rendered.
+    """
+    global _words_per_second
+    if _words_per_second is None:
+        words = 0
+        seconds = 0.0
+        videos = 0
+        for cues in transcripts.load_store().values():
+            if not cues:
+                continue
+            videos += 1
+            for start, end, text in cues:
+                words += len(text.split())
+                seconds += (end - start) / 1000
+        if videos >= MIN_CALIBRATION_VIDEOS and seconds > 0:
+            _words_per_second = words / seconds
+            print(f"Narration pace calibrated from {videos} transcripts: {_words_per_second:.2f} words/s")
+        else:
+            _words_per_second = DEFAULT_WORDS_PER_SECOND
+    return _words_per_second
+
+
+def _voiceover_texts(tree):
+    """Collects the narration strings passed to self.voiceover(text=...)."""
+    strings = {}
+    for node in ast.walk(tree):
+        if (isinstance(node, ast.Assign) and isinstance(node.value, ast.Constant)
+                and isinstance(node.value.value, str)):
+            for target in node.targets:
+                if isinstance(target, ast.Name):
+                    strings[target.id] = node.value.value
+
+    texts = []
+    for node in ast.walk(tree):
+        if (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute)
+                and node.func.attr == "voiceover"):
+            args = [kw.value for kw in node.keywords if kw.arg == "text"] or node.args[:1]
+            for arg in args:
+                if isinstance(arg, ast.Constant) and isinstance(arg.value, str):
+                    texts.append(arg.value)
+                elif isinstance(arg, ast.Name) and arg.id in strings:
+                    texts.append(strings[arg.id])
+    return texts
+
+
+def _explicit_waits(tree):
+    """Sums constant self.wait(...) durations outside the narration."""
+    total = 0.0
+    for node in ast.walk(tree):
+        if (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute)
+                and node.func.attr == "wait" and node.args
+                and isinstance(node.args[0], ast.Constant)
+                and isinstance(node.args[0].value, (int, float))):
+            total += node.args[0].value
+    return total
+
+
+def estimate_duration(script_content):
+    """
+    Estimates a scene's runtime in seconds from its narration length, before rendering.
+    Returns None if the script cannot be parsed; Manim will report that error itself.
+    """
+    try:
+        tree = ast.parse(script_content)
+    except SyntaxError:
+        return None
+    texts = _voiceover_texts(tree)
+    words = sum(len(text.split()) for text in texts)
+    return words / words_per_second() + len(texts) * TRANSITION_SECONDS + _explicit_waits(tree)
+
+
+def check_duration_budget(script_content):
+    """
+    Returns None if the script is within TRIM_ABOVE_SECONDS of narration, otherwise an error
+    message that asks the LLM to trim it towards TARGET_SECONDS.
+    """
+    estimate = estimate_duration(script_content)
+    if estimate is None or estimate <= TRIM_ABOVE_SECONDS:
+        return None
+    target_words = int((TARGET_SECONDS - TRANSITION_SECONDS * 5) * words_per_second())
+    return (
+        f"DurationBudgetError: the estimated video length is {estimate:.0f} seconds, but the video should be "
+        f"about {TARGET_SECONDS} seconds. Shorten the narration to roughly "
+        f"{target_words} words in total across all voiceover blocks and remove unnecessary waits, "
+        f"keeping the same structure."
+    )
+
+
+def record_view(video_id):
+    """Counts a view and returns True when the video has become popular enough to upgrade."""
+    with _lock:
+        _views[video_id] = _views.get(video_id, 0) + 1
+        return _views[video_id] % UPGRADE_VIEWS == 0
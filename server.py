@@ -1,23 +1,48 @@
+import time
+_IMPORT_STARTED = time.perf_counter() # Start of worker startup, reported by create_app()
+
 import os
 import glob
-import re
-import requests
+import threading
 from pathlib import Path
 import traceback
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Blueprint, Flask, current_app, request, jsonify, send_from_directory
 from flask_cors import CORS
+import config
 import main as video_generator # Imports the logic from your main.py
-from dotenv import load_dotenv
-
-load_dotenv()
+import transcripts
+import previews
+import render_policy
 
-app = Flask(__name__)
-# Enable Cross-Origin Resource Sharing to allow your frontend to call the backend
-CORS(app, origins="*")
+# Routes are registered on the app built by create_app()
+bp = Blueprint('api', __name__)
 
 # The base directory where Manim saves its output files ('media/videos/')
 VIDEO_DIR = Path(__file__).parent / "media" / "videos"
 
+# Parsed transcripts and the keyword index, built on first use
+_transcript_index = None
+_transcript_index_lock = threading.Lock()
+
+def get_transcript_index():
+    """Returns the shared TranscriptIndex, ingesting any un-indexed SRT files the first time."""
+    global _transcript_index
+    with _transcript_index_lock:
+        if _transcript_index is None:
+            transcripts.backfill(VIDEO_DIR)
+            _transcript_index = transcripts.TranscriptIndex()
+    return _transcript_index
+
+def find_resolution_dir(video_folder_path, video_file_name):
+    """
+    Returns the best-quality resolution folder (e.g. '1080p60') that contains the video,
+    or None if it has not been rendered at any quality.
+    """
+    for resolution_dir in render_policy.resolution_dirs():
+        if (Path(video_folder_path) / resolution_dir / video_file_name).exists():
+            return resolution_dir
+    return None
+
 # --- Helper Functions for Formatting ---
 
 def snake_to_pascal(snake_case_string):
@@ -29,7 +54,7 @@ def snake_to_title(snake_case_string):
     return " ".join(word.capitalize() for word in snake_case_string.split('_'))
 
 # --- NEW: API Endpoint to List Existing Videos ---
-@app.route('/send-to-zapier', methods=['POST'])
+@bp.route('/send-to-zapier', methods=['POST'])
 def send_to_zapier():
     data = request.json
     
@@ -40,6 +65,7 @@ def send_to_zapier():
     zapier_webhook_url = os.getenv("ZAPIER_WEBHOOK_URL")
     if not zapier_webhook_url:
         return jsonify({"message": "Zapier webhook URL not configured"}), 500
+    import requests # Only these proxy routes need it; imported on first use
     zapier_response = requests.post(zapier_webhook_url, json=data)
     
     # Check if the Zapier request was successful
@@ -50,7 +76,7 @@ def send_to_zapier():
         # Return an error message if Zapier failed to process the data
         return jsonify({"message": "Failed to send data to Zapier", "error": zapier_response.text}), 500
 
-@app.route('/api/list-videos', methods=['GET'])
+@bp.route('/api/list-videos', methods=['GET'])
 def list_videos():
     """
     Scans the VIDEO_DIR for existing video folders and returns a list of their metadata.
@@ -67,15 +93,34 @@ def list_videos():
                 video_id = folder_name.replace("generated_", "")
 
                 video_file_name = f"{snake_to_pascal(video_id)}.mp4"
-                video_file_path = os.path.join(folder_path, "480p15", video_file_name)
+                resolution_dir = find_resolution_dir(folder_path, video_file_name)
 
-                if os.path.exists(video_file_path):
+                if resolution_dir:
+                    video_file_path = os.path.join(folder_path, resolution_dir, video_file_name)
                     creation_time = os.path.getctime(video_file_path)
-                    videos.append({
+                    video = {
                         "id": video_id,
                         "title": snake_to_title(video_id),
-                        "created_at": creation_time * 1000 # JS uses milliseconds
-                    })
+                        "created_at": creation_time * 1000, # JS uses milliseconds
+                        "poster_url": None,
+                        "sprite_url": None,
+                    }
+                    found = previews.find_previews(video_file_path)
+                    if found:
+                        url_base = f"/videos/{folder_name}/{resolution_dir}/"
+                        video["poster_url"] = url_base + found["poster"].name
+                        video["sprite_url"] = url_base + found["sprite"].name
+                        video["sprite_layout"] = {
+                            "columns": previews.SPRITE_COLUMNS,
+                            "rows": previews.SPRITE_ROWS,
+                            "interval_seconds": found["interval"],
+                            # Frames start at 0 s, so the sheet covers up to this point
+                            "covered_seconds": round(found["interval"] * previews.SPRITE_COLUMNS * previews.SPRITE_ROWS, 3),
+                        }
+                    else:
+                        # Older video without previews; build them in the background for next time
+                        previews.schedule_previews(video_file_path)
+                    videos.append(video)
             except Exception as e:
                 print(f"Could not process folder {folder_path}: {e}")
 
@@ -84,7 +129,7 @@ def list_videos():
 
 # --- NEW: API Endpoint to Get Details for a Single Video ---
 
-@app.route('/api/video-details/<video_id>', methods=['GET'])
+@bp.route('/api/video-details/<video_id>', methods=['GET'])
 def get_video_details(video_id):
     """
     Returns detailed information for a single existing video, including its caption content.
@@ -94,44 +139,77 @@ def get_video_details(video_id):
     video_file = f"{pascal_case_id}.mp4"
     caption_file = f"{pascal_case_id}.srt"
     
+    # Serve the best quality that has been rendered so far
+    resolution_dir = find_resolution_dir(VIDEO_DIR / folder_name, video_file)
+    if not resolution_dir:
+        return jsonify({"error": "Video not found"}), 404
+
     # Construct paths using the robust VIDEO_DIR Path object
-    video_folder_path = VIDEO_DIR / folder_name / "480p15"
-    video_file_path = video_folder_path / video_file
+    video_folder_path = VIDEO_DIR / folder_name / resolution_dir
     caption_file_path = video_folder_path / caption_file
 
-    if not video_file_path.exists():
-        return jsonify({"error": "Video not found"}), 404
+    # Popular videos are re-rendered at the configured quality in the background
+    current_quality = render_policy.quality_for_resolution_dir(resolution_dir)
+    if render_policy.record_view(video_id) and current_quality != render_policy.max_quality():
+        video_generator.schedule_quality_upgrade(video_id)
 
-    caption_content = "Caption file not found."
-    try:
-        with open(caption_file_path, 'r', encoding='utf-8') as f:
-            caption_content = f.read()
-    except FileNotFoundError:
-        print(f"Warning: Caption file not found at {caption_file_path}")
-    except Exception as e:
-        print(f"Error reading caption file {caption_file_path}: {e}")
-        caption_content = "Error reading caption file."
+    cues = get_transcript_index().get(video_id)
+    if cues is None and caption_file_path.exists():
+        # Rendered before the index was built; parse it once and keep it
+        try:
+            cues = transcripts.ingest_srt(video_id, caption_file_path)
+        except Exception as e:
+            print(f"Error reading caption file {caption_file_path}: {e}")
+
+    if cues is None:
+        print(f"Warning: No transcript available for {caption_file_path}")
+        caption_content = "Caption file not found."
+        cues = []
+    else:
+        caption_content = transcripts.format_srt(cues)
 
     video_details = {
         "id": video_id,
         "title": snake_to_title(video_id),
         # This URL path MUST match your existing `serve_video` endpoint structure
-        "video_file_url": f"/videos/{folder_name}/480p15/{video_file}",
-        "caption_content": caption_content
+        "video_file_url": f"/videos/{folder_name}/{resolution_dir}/{video_file}",
+        "caption_content": caption_content,
+        "cues": [{"start": start / 1000, "end": end / 1000, "text": text} for start, end, text in cues]
     }
     return jsonify(video_details)
 
+# --- API Endpoint to Search Transcripts ---
+
+@bp.route('/api/search', methods=['GET'])
+def search_transcripts():
+    """
+    Finds videos whose narration contains every keyword in `q`, with the matching timestamped cues.
+    """
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({"error": "Query parameter 'q' is required"}), 400
+    try:
+        limit = int(request.args.get('limit', 20))
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    if limit < 1:
+        return jsonify({"error": "limit must be at least 1"}), 400
+
+    results = get_transcript_index().search(query, limit=limit)
+    for result in results:
+        result["title"] = snake_to_title(result["id"])
+    return jsonify(results)
+
 # --- Public config for frontend (safe values only) ---
-@app.route('/api/public-config', methods=['GET'])
+@bp.route('/api/public-config', methods=['GET'])
 def public_config():
-    import os
     return jsonify({
         "SUPABASE_URL": os.getenv("SUPABASE_URL"),
         "SUPABASE_ANON_KEY": os.getenv("SUPABASE_ANON_KEY"),
     })
 
 # --- Proxy: Generate quiz using Gemini API (server-side key) ---
-@app.route('/api/generate-quiz', methods=['POST'])
+@bp.route('/api/generate-quiz', methods=['POST'])
 def generate_quiz():
     try:
         data = request.get_json(force=True)
@@ -143,7 +221,7 @@ def generate_quiz():
         if not video_id:
             return jsonify({"error": "video_id is required"}), 400
 
-        import os
+        import requests # Only these proxy routes need it; imported on first use
         api_key = os.getenv("GEMINI_API_KEY")
         if not api_key:
             return jsonify({"error": "GEMINI_API_KEY not configured"}), 500
@@ -224,7 +302,7 @@ def generate_quiz():
 
 # --- EXISTING: Endpoint to Serve Video Files ---
 
-@app.route('/videos/<script_name>/<resolution>/<filename>')
+@bp.route('/videos/<script_name>/<resolution>/<filename>')
 def serve_video(script_name, resolution, filename):
     """
     Serves the video file from the complex directory structure that Manim creates.
@@ -236,7 +314,7 @@ def serve_video(script_name, resolution, filename):
 
 # --- EXISTING: Endpoint to Generate New Videos ---
 
-@app.route('/api/generate-video', methods=['POST'])
+@bp.route('/api/generate-video', methods=['POST'])
 def generate_video_endpoint():
     """
     API endpoint that receives a prompt from the frontend and initiates
@@ -250,10 +328,13 @@ def generate_video_endpoint():
 
     try:
         # Sanitize the prompt to create a valid Python module name (e.g., "fourier_transform")
-        sanitized_topic_module = re.sub(r'[^a-zA-Z0-9_]', '', prompt.replace(' ', '_')).lower()
+        sanitized_topic_module = video_generator.sanitize_topic_module(prompt)
         
         # This function handles the entire backend process
-        path_parts, transcript = video_generator.generate_video_process(prompt, sanitized_topic_module)
+        # Users wait on this render, so it is capped; popular videos are upgraded in the background
+        path_parts, transcript = video_generator.generate_video_process(
+            prompt, sanitized_topic_module, max_quality=render_policy.INTERACTIVE_MAX_QUALITY
+        )
         
         # Construct the URL that the frontend can use to fetch the video.
         # This now directly matches the '/videos/...' route.
@@ -277,8 +358,50 @@ def generate_video_endpoint():
 
         return jsonify({"error": error_message}), 500
 
+# --- Startup metrics ---
+
+@bp.route('/api/health', methods=['GET'])
+def health():
+    """Liveness check that also reports how long this worker took to start."""
+    return jsonify({
+        "status": "ok",
+        "startup_seconds": current_app.config["STARTUP_SECONDS"],
+    })
+
+def create_app():
+    """
+    Builds the Flask app. Environment and directories are resolved here, once per process,
+    and the Gemini SDK is only loaded when a video is first generated.
+    """
+    config.load_config()
+
+    app = Flask(__name__)
+    # Enable Cross-Origin Resource Sharing to allow your frontend to call the backend
+    CORS(app, origins="*")
+    app.register_blueprint(bp)
+
+    # Worker startup latency: module imports plus app construction
+    app.config["STARTUP_SECONDS"] = round(time.perf_counter() - _IMPORT_STARTED, 4)
+    print(f"Worker started in {app.config['STARTUP_SECONDS'] * 1000:.0f} ms")
+    return app
+
+_app = None
+
+def __getattr__(name):
+    """
+    Keeps `server:app` and `from server import app` working for existing deployments.
+    The app is built by create_app() on first access rather than on import.
+    """
+    global _app
+    if name == "app":
+        if _app is None:
+            _app = create_app()
+        return _app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 if __name__ == '__main__':
     # Runs the server on http://localhost:5000
+    app = create_app()
     print(f"Starting Flask server...")
     print(f"Video directory set to: {VIDEO_DIR.resolve()}")
     app.run(debug=True, port=5000, use_reloader=False)
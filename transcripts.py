@@ -0,0 +1,209 @@
+"""
+Structured transcripts and keyword search.
+
+SRT files are parsed once into compact cues (start ms, end ms, text) and kept in
+TRANSCRIPT_STORE next to the generation cache. TranscriptIndex loads that store into
+memory with an inverted index from word to cues, so detail views and searches never
+read SRT files per request.
+"""
+import json
+import re
+import threading
+import time
+import weakref
+from pathlib import Path
+
+TRANSCRIPT_STORE = Path("transcript_index.json")
+
+# How often (in seconds) the in-memory index checks whether another process updated the store
+REFRESH_INTERVAL = 30
+
+_TIMESTAMP = r'(\d{2}):(\d{2}):(\d{2})[,.](\d{3})'
+_CUE_TIMING = re.compile(_TIMESTAMP + r'\s*-->\s*' + _TIMESTAMP)
+_WORD = re.compile(r'[a-z0-9]+')
+
+_store_lock = threading.Lock()
+
+# Indexes in this process, updated in place whenever a new transcript is ingested
+_live_indexes = weakref.WeakSet()
+
+
+def _to_ms(hours, minutes, seconds, millis):
+    return ((int(hours) * 60 + int(minutes)) * 60 + int(seconds)) * 1000 + int(millis)
+
+
+def _format_timestamp(ms):
+    hours, ms = divmod(ms, 3_600_000)
+    minutes, ms = divmod(ms, 60_000)
+    seconds, ms = divmod(ms, 1000)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d},{ms:03d}"
+
+
+def parse_srt_cues(content):
+    """Parses SRT text into a list of [start_ms, end_ms, text] cues."""
+    cues = []
+    for block in re.split(r'\n\s*\n', content.replace('\r\n', '\n').strip()):
+        lines = block.strip().split('\n')
+        for i, line in enumerate(lines):
+            timing = _CUE_TIMING.search(line)
+            if timing:
+                text = ' '.join(l.strip() for l in lines[i + 1:] if l.strip())
+                if text:
+                    cues.append([_to_ms(*timing.groups()[:4]), _to_ms(*timing.groups()[4:]), text])
+                break
+    return cues
+
+
+def format_srt(cues):
+    """Rebuilds SRT text from cues, for clients that expect the raw caption file."""
+    return "\n\n".join(
+        f"{number}\n{_format_timestamp(start)} --> {_format_timestamp(end)}\n{text}"
+        for number, (start, end, text) in enumerate(cues, start=1)
+    ) + "\n"
+
+
+def transcript_text(cues):
+    """Joins cue texts into a single plain transcript."""
+    return ' '.join(text for _, _, text in cues)
+
+
+def tokenize(text):
+    return _WORD.findall(text.lower())
+
+
+def load_store():
+    """Loads the {video_id: cues} transcript store."""
+    if TRANSCRIPT_STORE.exists():
+        try:
+            return json.loads(TRANSCRIPT_STORE.read_text(encoding='utf-8'))
+        except json.JSONDecodeError:
+            print(f"Warning: transcript store {TRANSCRIPT_STORE} is corrupt, ignoring it.")
+    return {}
+
+
+def save_transcripts(entries):
+    """Merges {video_id: cues} entries into the transcript store on disk."""
+    with _store_lock:
+        store = load_store()
+        store.update(entries)
+        tmp_path = TRANSCRIPT_STORE.with_name(TRANSCRIPT_STORE.name + ".tmp")
+        tmp_path.write_text(json.dumps(store, separators=(',', ':')), encoding='utf-8')
+        tmp_path.replace(TRANSCRIPT_STORE)
+
+
+def ingest_srt(video_id, srt_path):
+    """
+    Parses an SRT file once, records its cues in the store and adds them to any
+    TranscriptIndex in this process. Returns the cues.
+    """
+    cues = parse_srt_cues(Path(srt_path).read_text(encoding='utf-8'))
+    save_transcripts({video_id: cues})
+    store_mtime = TRANSCRIPT_STORE.stat().st_mtime
+    for index in list(_live_indexes):
+        index.add(video_id, cues, store_mtime=store_mtime)
+    return cues
+
+
+def backfill(video_dir):
+    """Ingests SRT files of videos rendered before the store existed."""
+    store = load_store()
+    missing = {}
+    for srt_path in Path(video_dir).glob("generated_*/*/*.srt"):
+        video_id = srt_path.parent.parent.name.replace("generated_", "", 1)
+        if video_id not in store and video_id not in missing:
+            try:
+                missing[video_id] = parse_srt_cues(srt_path.read_text(encoding='utf-8'))
+            except Exception as e:
+                print(f"Could not parse caption file {srt_path}: {e}")
+    if missing:
+        print(f"Ingesting {len(missing)} transcripts into {TRANSCRIPT_STORE}")
+        save_transcripts(missing)
+
+
+class TranscriptIndex:
+    """In-memory view of the transcript store with an inverted word index."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cues = {}
+        self._postings = {}
+        self._store_mtime = None
+        self._checked_at = 0.0
+        self.reload()
+        _live_indexes.add(self)
+
+    def reload(self):
+        """Rebuilds the index from the store on disk."""
+        mtime = TRANSCRIPT_STORE.stat().st_mtime if TRANSCRIPT_STORE.exists() else None
+        store = load_store()
+        postings = {}
+        for video_id, cues in store.items():
+            for cue_number, (_, _, text) in enumerate(cues):
+                for word in set(tokenize(text)):
+                    postings.setdefault(word, []).append((video_id, cue_number))
+        with self._lock:
+            self._cues = store
+            self._postings = postings
+            self._store_mtime = mtime
+            self._checked_at = time.monotonic()
+
+    def add(self, video_id, cues, store_mtime=None):
+        """
+        Adds or replaces a single video's cues without re-reading the store.
+        Pass the store's mtime after writing these cues so the write is not mistaken for
+        an update from another process.
+        """
+        with self._lock:
+            if store_mtime is not None:
+                self._store_mtime = store_mtime
+            if video_id in self._cues:
+                self._postings = {
+                    word: [p for p in postings if p[0] != video_id]
+                    for word, postings in self._postings.items()
+                }
+            self._cues[video_id] = cues
+            for cue_number, (_, _, text) in enumerate(cues):
+                for word in set(tokenize(text)):
+                    self._postings.setdefault(word, []).append((video_id, cue_number))
+
+    def _refresh_if_stale(self):
+        # Picks up transcripts written by other processes (e.g. batch_generate.py), at most once per interval
+        if time.monotonic() - self._checked_at < REFRESH_INTERVAL:
+            return
+        self._checked_at = time.monotonic()
+        mtime = TRANSCRIPT_STORE.stat().st_mtime if TRANSCRIPT_STORE.exists() else None
+        if mtime != self._store_mtime:
+            self.reload()
+
+    def get(self, video_id):
+        """Returns the cues for a video, or None if it has no transcript."""
+        self._refresh_if_stale()
+        return self._cues.get(video_id)
+
+    def search(self, query, limit=20):
+        """
+        Finds videos whose narration contains every word of the query, in any cue.
+        Returns a list of {"id", "matches": [{"start", "end", "text"}]}, where matches are the
+        cues containing any of the words, ordered by number of matching cues.
+        """
+        self._refresh_if_stale()
+        words = set(tokenize(query))
+        if not words:
+            return []
+        with self._lock:
+            postings = [self._postings.get(word, []) for word in words]
+            videos = set.intersection(*({video_id for video_id, _ in p} for p in postings))
+            cue_numbers = {}
+            for p in postings:
+                for video_id, cue_number in p:
+                    if video_id in videos:
+                        cue_numbers.setdefault(video_id, set()).add(cue_number)
+            results = []
+            for video_id, numbers in cue_numbers.items():
+                matches = []
+                for cue_number in sorted(numbers):
+                    start, end, text = self._cues[video_id][cue_number]
+                    matches.append({"start": start / 1000, "end": end / 1000, "text": text})
+                results.append({"id": video_id, "matches": matches})
+        results.sort(key=lambda r: (-len(r["matches"]), r["id"]))
+        return results[:limit]